@@ -0,0 +1,396 @@
+import sys
+from typing import Any
+
+import gamspy as gp
+import numpy as np
+import pandas as pd
+from scipy.stats import norm
+
+# Shared by advent_of_or/ and advent_of_or_nextmvified/, each of which ships its
+# own copy so the two apps stay deployable on their own. Keep the copies identical.
+
+
+def build_model(
+    segments: pd.DataFrame,
+    assets: pd.DataFrame,
+    correlation_df: pd.DataFrame,
+    options: Any,
+) -> dict[str, Any]:
+    """Declares the rebalancing model in the active container, loads the instance
+    data and returns the symbols, expressions and models by name."""
+    A = gp.Set(description="Set of all assets in the portfolio")
+    S = gp.Set(description="Set of segments")
+    AS = gp.Set(domain=[A, S])
+    J = gp.Alias(alias_with=A)
+
+    profitability = gp.Parameter(
+        domain=[A, S],
+        description="Expected profitability for asset a, segment s",
+    )
+    risk_weight_limit = gp.Parameter(
+        description="Maximum allowable average risk weight at the portfolio level",
+    )
+    z_score = gp.Parameter(
+        description="Z-score for risk calculation (default: corresponding to 95 percent confidence level in one tail test)",
+    )
+    lo_a = gp.Parameter(
+        domain=A,
+        description="Lower bound for asset `a` relative exposure",
+    )
+    up_a = gp.Parameter(
+        domain=A,
+        description="Upper bound for asset `a` relative exposure",
+    )
+    rel_origination_cost = gp.Parameter(
+        domain=[A, S],
+        description="Per unit cost of increasing the exposure of segment s for asset a",
+    )
+    rel_sell_cost = gp.Parameter(
+        domain=[A, S],
+        description="Per unit cost of decreasing the exposure of segment s for asset a",
+    )
+    r = gp.Parameter(
+        domain=[A, S],
+        description="Risk weight of segment s for asset a",
+    )
+    exposure = gp.Parameter(
+        domain=[A, S],
+        description="Current exposure of segment s for asset a.",
+    )
+    current_asset_exposure = gp.Parameter(
+        domain=A,
+        description="Total exposure of asset a",
+    )
+    profit_stdev = gp.Parameter(domain=A)
+    correlation_matrix = gp.Parameter(domain=[A, J])
+
+    segment_vars = gp.Variable(
+        domain=[A, S],
+        description="Multiplier of original exposure for segment s, asset a in the rebalanced portfolio",
+        type="Positive",
+    )
+    segment_increase_vars = gp.Variable(
+        domain=[A, S],
+        description="Increase multiplier of original exposure for segment s, asset a in the rebalanced portfolio",
+        type="Positive",
+    )
+    segment_decrease_vars = gp.Variable(
+        domain=[A, S],
+        description="Decrease multiplier of original exposure for segment s, asset a in the rebalanced portfolio",
+        type="Positive",
+    )
+    new_total_exposure = gp.Variable(
+        description="Total exposure in new rebalanced portfolio",
+        type="Positive",
+    )
+    portfolio_exposure_vars = gp.Variable(
+        domain=A,
+        description="Total exposure in new rebalanced portfolio for asset a",
+        type="Positive",
+    )
+
+    ### --- Constraints --- ###
+    # 1. Segment Relationship Constraint
+    segment_relationship = gp.Equation(
+        domain=[A, S],
+        description="This establishes the relationship between the main segment variables and their increase/decrease components.",
+    )
+    segment_relationship[AS] = (
+        segment_vars[AS] == 1 + segment_increase_vars[AS] - segment_decrease_vars[AS]
+    )
+
+    # 2. Asset Exposure Relationship Constraint
+    asset_exposure = gp.Equation(
+        domain=A,
+        description="This establishes the relationship between the per segment ratio and the asset level exposure of the rebalanced portfolio.",
+    )
+    asset_exposure[A] = (
+        gp.Sum(AS[A, S], exposure[AS] * segment_vars[AS]) == portfolio_exposure_vars[A]
+    )
+
+    # 3. Risk Weight Constraint
+    risk_weight = gp.Equation(
+        description="This constraint keeps the average risk weight at the portfolio-level below the user-defined threshold.",
+    )
+    risk_weight[...] = (
+        gp.Sum(AS, r[AS] * exposure[AS] * segment_vars[AS])
+        <= risk_weight_limit * new_total_exposure
+    )
+
+    # 4. Total Exposure Relationship Constraint
+    total_exposure = gp.Equation(
+        description="This establishes the relationship between the per asset exposure and the total exposure of the rebalanced portfolio.",
+    )
+    total_exposure[...] = gp.Sum(A, portfolio_exposure_vars[A]) == new_total_exposure
+
+    ### --- Objectives --- ###
+    # 1. Maximize expected net profit
+    profit = gp.Sum(AS, profitability[AS] * exposure[AS] * segment_vars[AS])
+    transaction_cost = gp.Sum(
+        AS,
+        rel_origination_cost[AS] * exposure[AS] * segment_increase_vars[AS]
+        + rel_sell_cost[AS] * exposure[AS] * segment_decrease_vars[AS],
+    )
+    profit_objective_variable = gp.Variable()
+    net_profit = (
+        profit - transaction_cost == profit_objective_variable
+    )  ## Why is this done this way.
+    profit_equation = gp.Equation(definition=net_profit)
+
+    # 2. Minimize risk
+    profit_downside_var = gp.Variable(type="Positive")
+    weight = gp.Variable(
+        domain=A,
+        description="Share of asset a in the total exposure of the rebalanced portfolio",
+        type="Positive",
+    )
+    weight_definition = gp.Equation(
+        domain=A,
+        description="This defines the asset weights so that the variance needs no division by the total exposure.",
+    )
+    weight_definition[A] = weight[A] * new_total_exposure == portfolio_exposure_vars[A]
+
+    # The correlation matrix is symmetric, so the diagonal is summed once and
+    # each pair above it once with a factor of 2 instead of the full A x J square.
+    # Uncorrelated pairs are left out of UT, so an identity matrix leaves only
+    # the diagonal terms.
+    UT = gp.Set(
+        domain=[A, J],
+        description="Correlated asset pairs above the diagonal of the correlation matrix",
+    )
+    variance = gp.Sum(
+        A,
+        profit_stdev[A]
+        * profit_stdev[A]
+        * correlation_matrix[A, A]
+        * weight[A]
+        * weight[A],
+    ) + 2 * gp.Sum(
+        UT[A, J],
+        profit_stdev[A]
+        * profit_stdev[J]
+        * correlation_matrix[A, J]
+        * weight[A]
+        * weight[J],
+    )
+    risk_equation = gp.Equation(
+        definition=z_score * profit * gp.math.sqrt(variance) <= profit_downside_var
+    )
+
+    alpha = gp.Parameter()
+    objective = alpha * profit_objective_variable - (1 - alpha) * profit_downside_var
+    base_equations = [
+        risk_weight,
+        segment_relationship,
+        asset_exposure,
+        total_exposure,
+        profit_equation,
+    ]
+    model = gp.Model(
+        problem=gp.Problem.QCP,
+        sense=gp.Sense.MAX,
+        equations=base_equations,
+        objective=objective,
+    )
+    # Declared once so the risk phase reuses the symbols (and the levels of the
+    # profit phase as its starting point) instead of mutating `model` in place.
+    risk_model = gp.Model(
+        problem=gp.Problem.NLP,
+        sense=gp.Sense.MAX,
+        equations=base_equations + [weight_definition, risk_equation],
+        objective=objective,
+    )
+
+    symbols = {
+        "A": A,
+        "S": S,
+        "AS": AS,
+        "J": J,
+        "UT": UT,
+        "profitability": profitability,
+        "risk_weight_limit": risk_weight_limit,
+        "lo_a": lo_a,
+        "up_a": up_a,
+        "rel_origination_cost": rel_origination_cost,
+        "rel_sell_cost": rel_sell_cost,
+        "r": r,
+        "profit_stdev": profit_stdev,
+        "correlation_matrix": correlation_matrix,
+        "exposure": exposure,
+        "current_asset_exposure": current_asset_exposure,
+        "z_score": z_score,
+        "segment_vars": segment_vars,
+        "new_total_exposure": new_total_exposure,
+        "portfolio_exposure_vars": portfolio_exposure_vars,
+        "profit_objective_variable": profit_objective_variable,
+        "profit": profit,
+        "transaction_cost": transaction_cost,
+        "profit_downside_var": profit_downside_var,
+        "weight": weight,
+        "variance": variance,
+        "alpha": alpha,
+        "model": model,
+        "risk_model": risk_model,
+    }
+    load_data(symbols, segments, assets, correlation_df, options)
+
+    return symbols
+
+
+def load_data(
+    symbols: dict[str, Any],
+    segments: pd.DataFrame,
+    assets: pd.DataFrame,
+    correlation_df: pd.DataFrame,
+    options: Any,
+) -> None:
+    """(Re)loads the instance data into the symbols returned by build_model."""
+    A = symbols["A"]
+    portfolio_exposure_vars = symbols["portfolio_exposure_vars"]
+    current_asset_exposure = symbols["current_asset_exposure"]
+
+    A.setRecords(assets["asset"].unique())
+    symbols["S"].setRecords(segments["segment_id"])
+    symbols["AS"].setRecords(segments[["asset", "segment_id"]])
+    symbols["profitability"].setRecords(
+        segments[["asset", "segment_id", "average_profitability"]]
+    )
+    symbols["risk_weight_limit"].setRecords(options.risk_weight_limit)
+    symbols["z_score"].setRecords(norm.ppf(options.confidence_interval))
+    symbols["lo_a"].setRecords(assets[["asset", "max_exposure_decrease"]])
+    symbols["up_a"].setRecords(assets[["asset", "max_exposure_increase"]])
+    symbols["rel_origination_cost"].setRecords(
+        segments[["asset", "segment_id", "rel_origination_cost"]]
+    )
+    symbols["rel_sell_cost"].setRecords(
+        segments[["asset", "segment_id", "rel_sell_cost"]]
+    )
+    symbols["r"].setRecords(segments[["asset", "segment_id", "risk_weight"]])
+    symbols["exposure"].setRecords(segments[["asset", "segment_id", "exposure"]])
+    current_asset_exposure.setRecords(
+        segments.groupby("asset", as_index=False)["exposure"].sum()
+    )
+    symbols["profit_stdev"].setRecords(assets[["asset", "stdev_profitability"]])
+
+    # The variance only reads the diagonal and the nonzero entries of the upper
+    # triangle (in the order of A), so only those are loaded.
+    asset_order = assets["asset"].unique()
+    correlation = (
+        correlation_df.set_index("asset")
+        .reindex(index=asset_order, columns=asset_order)
+        .to_numpy(dtype=np.float64)
+    )
+    if np.isnan(correlation).any():
+        raise ValueError(
+            "The correlation matrix is missing entries for some of the assets."
+        )
+    # Both orders of a pair are folded into the upper triangle. The variance
+    # counts each such entry twice (2 * UT), so their mean is stored, which keeps
+    # the full double sum even for an asymmetric input.
+    correlation = (correlation + correlation.T) / 2
+    rows, cols = np.triu_indices(len(asset_order))
+    keep = (rows == cols) | (correlation[rows, cols] != 0)
+    rows, cols = rows[keep], cols[keep]
+    pairs = pd.DataFrame(
+        {
+            "asset": asset_order[rows],
+            "asset_j": asset_order[cols],
+            "value": correlation[rows, cols],
+        }
+    )
+    symbols["correlation_matrix"].setRecords(pairs)
+    symbols["UT"].setRecords(pairs.loc[rows != cols, ["asset", "asset_j"]])
+
+    portfolio_exposure_vars.lo[A] = (1 - symbols["lo_a"][A]) * current_asset_exposure[A]
+    portfolio_exposure_vars.up[A] = (1 + symbols["up_a"][A]) * current_asset_exposure[A]
+    symbols["new_total_exposure"].l[...] = options.new_total_exposure_initial_value
+    # Drop what a previous solve may have left behind: the lexicographic profit
+    # floor, and a downside level that a solve without risk would report as is.
+    symbols["profit_objective_variable"].lo[...] = gp.SpecialValues.NEGINF
+    symbols["profit_downside_var"].l[...] = 0
+
+
+def solve_model(
+    symbols: dict[str, Any], options: Any, threads: int | None = None
+) -> None:
+    """Solves the model returned by build_model according to the risk options.
+
+    threads caps the solver threads, e.g. 1 when several solves run side by side.
+    """
+    solve_options = gp.Options(threads=threads)
+    alpha = symbols["alpha"]
+    model = symbols["model"]
+    risk_model = symbols["risk_model"]
+    profit_objective_variable = symbols["profit_objective_variable"]
+    A = symbols["A"]
+    J = symbols["J"]
+    weight = symbols["weight"]
+    current_asset_exposure = symbols["current_asset_exposure"]
+    portfolio_exposure_vars = symbols["portfolio_exposure_vars"]
+    new_total_exposure = symbols["new_total_exposure"]
+    profit_downside_var = symbols["profit_downside_var"]
+    z_score = symbols["z_score"]
+    profit = symbols["profit"]
+    variance = symbols["variance"]
+
+    if options.consider_risk:
+        if options.profit_weight < 0:  # lexicographic
+            alpha[...] = 1
+            model.solve(solver="xpress", output=sys.stdout, options=solve_options)
+            rel_tol = 0.1
+            profit_objective_variable.lo = profit_objective_variable.l * (1 - rel_tol)
+
+            # The profit phase levels are the starting point of the risk phase;
+            # complete them with the weights and downside they imply so the risk
+            # equations hold too.
+            weight.l[A] = portfolio_exposure_vars.l[A] / new_total_exposure.l
+            profit_downside_var.l[...] = z_score * profit * gp.math.sqrt(variance)
+
+            alpha[...] = 0
+            risk_model.solve(
+                solver="xpress",
+                output=sys.stdout,
+                options=gp.Options(
+                    relative_optimality_gap=options.relative_optimality_gap,
+                    threads=threads,
+                ),
+            )
+        else:  # weighted
+            # Start from the weights of the current portfolio: with all weights at
+            # 0 the variance is 0, where sqrt in the risk equation has no derivative.
+            weight.l[A] = current_asset_exposure[A] / gp.Sum(
+                J, current_asset_exposure[J]
+            )
+            profit_downside_var.l[...] = z_score * profit * gp.math.sqrt(variance)
+
+            alpha[...] = options.profit_weight
+            risk_model.solve(solver="xpress", output=sys.stdout, options=solve_options)
+    else:
+        alpha[...] = 1
+        model.solve(solver="xpress", output=sys.stdout, options=solve_options)
+
+
+class PortfolioSolver:
+    """Keeps one gp.Container and the model declared in it across solves, so
+    repeated scenarios only reload data instead of rebuilding the model."""
+
+    def __init__(self, threads: int | None = None):
+        self.container = gp.Container()
+        self.threads = threads
+        self.symbols: dict[str, Any] | None = None
+
+    def solve(
+        self,
+        segments: pd.DataFrame,
+        assets: pd.DataFrame,
+        correlation_df: pd.DataFrame,
+        options: Any,
+    ) -> dict[str, Any]:
+        with self.container:
+            if self.symbols is None:
+                self.symbols = build_model(segments, assets, correlation_df, options)
+            else:
+                load_data(self.symbols, segments, assets, correlation_df, options)
+            solve_model(self.symbols, options, self.threads)
+
+        return self.symbols
@@ -1,5 +1,4 @@
 from instance_manager import InstanceManager
-from portfolio_optimizer import optimize_portfolio
 import os
 import pandas as pd
 
@@ -7,6 +6,9 @@ def solve_optimization(df_segments: pd.DataFrame, df_assets: pd.DataFrame,
                        df_correlation_matrix: pd.DataFrame, risk_weight_limit: float, 
                        consider_risk:bool = True, z_score: float = 1.96, profit_weight: float=None) ->pd.DataFrame:
 
+    # Deferred so that importing this module does not load xpress
+    from portfolio_optimizer import optimize_portfolio
+
     # Load instance from CSV
     manager = InstanceManager(instance_name="")
     original_portfolio = manager.from_csv(df_segments, df_assets, df_correlation_matrix)
@@ -0,0 +1,12 @@
+import numpy as np
+
+
+def portfolio_variance(w: np.ndarray, s: np.ndarray, C: np.ndarray) -> float:
+    """
+    Variance of the portfolio return for asset weights w, standard deviations s and correlation matrix C.
+
+    Computes sum_ij w_i s_i C_ij w_j s_j by scaling the weights with the standard deviations first,
+    so the covariance matrix s s' * C is never formed.
+    """
+    ws = w * s
+    return float(ws @ C @ ws)
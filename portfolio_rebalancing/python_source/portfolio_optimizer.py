@@ -1,6 +1,10 @@
-import xpress as xp
+import numpy as np
 from domain import Portfolio
 
+# Shape (segments, assets and whether risk is considered) and column values of the most recently solved model,
+# used as the starting point when the next call in the same process builds a model of the same shape
+_previous_solution = None
+
 def optimize_portfolio(portfolio: Portfolio, risk_weight_limit: float, consider_risk: bool = True, z_score: float = 1.96, profit_weight: float=None) -> None:
     """
     Optimize the portfolio to maximize profit while keeping the average risk weight below a specified limit.
@@ -10,6 +14,10 @@ def optimize_portfolio(portfolio: Portfolio, risk_weight_limit: float, consider_
     - risk_weight_limit: Maximum allowable average risk weight for the entire portfolio.
     """
 
+    import xpress as xp
+
+    global _previous_solution
+
     print(f"Printing correlation matrix")
     print(portfolio.correlation_matrix)
     print(f"profit_weight {profit_weight} and consider_risk {consider_risk}")
@@ -18,10 +26,27 @@ def optimize_portfolio(portfolio: Portfolio, risk_weight_limit: float, consider_
     model = xp.problem()
     
     # Decision variables: whether to increase origination (>1) or decrease for each segment (<1)
-    segments = []
+    # Walk the portfolio once and keep the segment data as parallel arrays that
+    # every constraint and objective term below indexes into
+    flat = [(asset.asset_id, segment.segment_id, segment.exposure, segment.risk_weight, segment.profitability,
+             segment.rel_origination_cost, segment.rel_sell_cost)
+            for asset in portfolio.assets.values()
+            for segment in asset.segments.values()]
+    n = len(flat)
+    segments = [(row[0], row[1]) for row in flat]
+    exposure, risk_weight, profitability, origination_cost, sell_cost = (
+        np.fromiter((row[k] for row in flat), dtype=np.float64, count=n) for k in range(2, 7))
+    # Coefficients of the segment variables in the risk weight row and the objective terms
+    exposure_risk_weight = exposure * risk_weight
+    exposure_profitability = exposure * profitability
+    exposure_origination_cost = exposure * origination_cost
+    exposure_sell_cost = exposure * sell_cost
+    # The segments of each asset are contiguous in the arrays above, so each asset maps to a slice of them
+    asset_positions = {}
+    start = 0
     for asset in portfolio.assets.values():
-        for segment in asset.segments.values():
-            segments.append((asset.asset_id, segment.segment_id))
+        asset_positions[asset.asset_id] = slice(start, start + len(asset.segments))
+        start += len(asset.segments)
 
     segment_vars = model.addVariables(segments, vartype=xp.continuous, lb=0.0)
     
@@ -29,6 +54,12 @@ def optimize_portfolio(portfolio: Portfolio, risk_weight_limit: float, consider_
     segment_increase_vars = model.addVariables(segments, vartype=xp.continuous, lb=0.0, name="increase")
     segment_decrease_vars = model.addVariables(segments, vartype=xp.continuous, lb=0.0, name="decrease")
 
+    # Variables in the order of the segment arrays so that linear terms can be
+    # passed to xp.Dot in bulk
+    segment_var_array = np.array([segment_vars[key] for key in segments], dtype=object)
+    segment_increase_array = np.array([segment_increase_vars[key] for key in segments], dtype=object)
+    segment_decrease_array = np.array([segment_decrease_vars[key] for key in segments], dtype=object)
+
     # Decision variable: Value of new total exposure
     new_total_exposure = model.addVariable(name="new_total_exposure", vartype=xp.continuous, lb=0.0)
 
@@ -38,46 +69,70 @@ def optimize_portfolio(portfolio: Portfolio, risk_weight_limit: float, consider_
     # Decision variable: RWA variance
     profit_downside_var = model.addVariable(name="RWA_variance", vartype=xp.continuous, lb=0.0)    
 
+    # The linear rows below are handed to Xpress in one addRows call, each as its type, right-hand side and the
+    # columns and coefficients of its nonzeros, instead of being built as Python expressions
+    segment_cols = np.array([var.index for var in segment_var_array], dtype=np.int64)
+    increase_cols = np.array([var.index for var in segment_increase_array], dtype=np.int64)
+    decrease_cols = np.array([var.index for var in segment_decrease_array], dtype=np.int64)
+    total_col = new_total_exposure.index
+
     # Constraint: Establish relationship between increase/decrease variables to segment variables i.e. x_s = 1 + x(increase)_s - x(decrease)_s for all s
-    model.addConstraint(segment_vars[(asset.asset_id, segment.segment_id)] == 1 + segment_increase_vars[(asset.asset_id, segment.segment_id)] - segment_decrease_vars[(asset.asset_id, segment.segment_id)]
-                        for asset in portfolio.assets.values()
-                        for segment in asset.segments.values())
+    row_types = ['E'] * n
+    row_rhs = [np.ones(n)]
+    row_lengths = [np.full(n, 3)]
+    row_cols = [np.column_stack((segment_cols, increase_cols, decrease_cols)).ravel()]
+    row_coefs = [np.tile([1.0, -1.0, 1.0], n)]
 
     # Constraint: Capture the new updated total exposure, i.e. sum_{s in S} exposure_s*x_s = new_total_exposure
-    model.addConstraint(xp.Sum(segment.exposure * segment_vars[(asset.asset_id, segment.segment_id)]
-                            for asset in portfolio.assets.values()
-                            for segment in asset.segments.values()) == new_total_exposure)
-    
     # Constraint: Keep average risk weight below the user-specified limit i.e. sum_{s in S} risk_s*exposure_s*x_s <= target_risk_weight * new_total_exposure
-    model.addConstraint(xp.Sum(segment.exposure * segment.risk_weight * segment_vars[(asset.asset_id, segment.segment_id)]
-                                        for asset in portfolio.assets.values()
-                                        for segment in asset.segments.values()) <= risk_weight_limit * new_total_exposure)
-    
+    row_types += ['E', 'L']
+    row_rhs.append(np.zeros(2))
+    row_lengths.append(np.full(2, n + 1))
+    row_cols += [np.append(segment_cols, total_col)] * 2
+    row_coefs += [np.append(exposure, -1.0), np.append(exposure_risk_weight, -risk_weight_limit)]
+
     # Constraint: Capture asset exposures i.e. sum_{s in S_a} exposure_s*x_s = e_a
-    model.addConstraint(xp.Sum(segment.exposure * segment_vars[(asset.asset_id, segment.segment_id)]
-                            for segment in asset.segments.values()) == portfolio_exposure_vars[asset.asset_id] for asset in portfolio.assets.values())
+    for asset_id, positions in asset_positions.items():
+        asset_cols = segment_cols[positions]
+        row_types.append('E')
+        row_rhs.append(np.zeros(1))
+        row_lengths.append(np.full(1, asset_cols.size + 1))
+        row_cols.append(np.append(asset_cols, portfolio_exposure_vars[asset_id].index))
+        row_coefs.append(np.append(exposure[positions], -1.0))
+
+    row_lengths = np.concatenate(row_lengths)
+    model.addRows(row_types, np.concatenate(row_rhs), start=np.concatenate(([0], np.cumsum(row_lengths)[:-1])),
+                  colind=np.concatenate(row_cols), rowcoef=np.concatenate(row_coefs))
 
     # Constraint: Keep portfolio exposures within allowable limits l_a<= e_a<= u_a
-    model.addConstraint(portfolio_exposure_vars[asset.asset_id] >= asset.min_rel_exposure * asset.total_exposure for asset in portfolio.assets.values())
-    model.addConstraint(portfolio_exposure_vars[asset.asset_id] <= asset.max_rel_exposure * asset.total_exposure for asset in portfolio.assets.values())
+    lower_bounds = [portfolio_exposure_vars[asset.asset_id] >= asset.min_rel_exposure * asset.total_exposure for asset in portfolio.assets.values()]
+    upper_bounds = [portfolio_exposure_vars[asset.asset_id] <= asset.max_rel_exposure * asset.total_exposure for asset in portfolio.assets.values()]
+    model.addConstraint(lower_bounds, upper_bounds)
 
     # Objective: Maximize total profit
-    profit = xp.Sum(segment.profitability * segment.exposure * segment_vars[(asset.asset_id, segment.segment_id)] for asset in portfolio.assets.values() for segment in asset.segments.values())
-    transaction_cost = xp.Sum(segment.rel_origination_cost * segment.exposure * segment_increase_vars[(asset.asset_id, segment.segment_id)] 
-                       +segment.rel_sell_cost * segment.exposure * segment_decrease_vars[(asset.asset_id, segment.segment_id)]
-                       for asset in portfolio.assets.values()
-                       for segment in asset.segments.values())
+    profit = xp.Dot(exposure_profitability, segment_var_array)
+    transaction_cost = (xp.Dot(exposure_origination_cost, segment_increase_array)
+                        + xp.Dot(exposure_sell_cost, segment_decrease_array))
     net_profit_objective = profit-transaction_cost
     model.addObjective(net_profit_objective)
 
     # Considering portfolio variance in our optimization
     if consider_risk:
         # Constraint: Capture the variance based on covariance between assets
-        variance = xp.Sum(asset_i.profit_stdev * asset_j.profit_stdev * 
-                        portfolio.correlation_matrix.loc[asset_i.asset_id, asset_j.asset_id] * 
-                        portfolio_exposure_vars[asset_i.asset_id] * portfolio_exposure_vars[asset_j.asset_id]/(new_total_exposure * new_total_exposure)
-                        for asset_i in portfolio.assets.values()
-                        for asset_j in portfolio.assets.values())
+        # Correlations aligned to the asset order once, indexed by position below
+        asset_list = list(portfolio.assets.values())
+        asset_ids = [asset.asset_id for asset in asset_list]
+        correlation = portfolio.correlation_matrix.reindex(index=asset_ids, columns=asset_ids).to_numpy(dtype=np.float64)
+        # The summand is symmetric in (i, j), so each pair above the diagonal is
+        # taken once with the correlations of both orders added up
+        pair_correlation = np.triu(correlation + correlation.T, k=1) + np.diag(np.diag(correlation))
+        asset_stdev = np.array([asset.profit_stdev for asset in asset_list], dtype=np.float64)
+        covariance_coef = np.outer(asset_stdev, asset_stdev) * pair_correlation
+        asset_exposure_vars = [portfolio_exposure_vars[asset_id] for asset_id in asset_ids]
+        # Only the nonzero coefficients of the upper triangle generate terms
+        rows, cols = np.nonzero(covariance_coef)
+        variance = xp.Sum(covariance_coef[i, j] * asset_exposure_vars[i] * asset_exposure_vars[j]
+                          for i, j in zip(rows.tolist(), cols.tolist()))/(new_total_exposure * new_total_exposure)
         model.addConstraint(z_score * profit * xp.sqrt(variance) <= profit_downside_var)
         # Insert the objective function
         variance_objective = profit_downside_var
@@ -101,6 +156,12 @@ def optimize_portfolio(portfolio: Portfolio, risk_weight_limit: float, consider_
     model.controls.miprelstop = 0.01
     model.setOutputEnabled(True)
     
+    # Warm start the nonlinear solve from the previous solution of the same model shape
+    model_key = (tuple(segments), tuple(portfolio.assets.keys()), consider_risk)
+    if consider_risk and _previous_solution is not None and _previous_solution[0] == model_key:
+        previous_values = _previous_solution[1]
+        model.nlpSetInitVal(list(range(len(previous_values))), previous_values)
+
     # Solve the optimization problem
     _, solstatus = model.optimize()
 
@@ -111,6 +172,7 @@ def optimize_portfolio(portfolio: Portfolio, risk_weight_limit: float, consider_
     new_exposure = 0
     if solstatus in (xp.SolStatus.OPTIMAL,xp.SolStatus.FEASIBLE):
         investment = model.getSolution(segment_vars)
+        _previous_solution = (model_key, model.getSolution())
         expected_profit = xp.evaluate(net_profit_objective, problem=model)
         profit_stdev = model.getSolution(profit_downside_var)/(z_score*xp.evaluate(profit, problem=model))
         new_exposure = model.getSolution(new_total_exposure)
@@ -6,14 +6,37 @@ import os
 import sys
 
 import nextmv
+import numpy as np
 import pandas as pd
 import xpressinsight as xi
 from entry_point import solve_optimization
-from scipy.stats import norm
+from portfolio_math import portfolio_variance
 
 manifest = nextmv.Manifest.from_yaml(dirpath=os.path.join(os.path.dirname(__file__), ".."))
 options = manifest.extract_options()
 
+# Parsed input files keyed by path, index column and column types, each stored with the modification time it was
+# read at, so that repeated loads of unchanged attachments in the same process skip the CSV parsing. A file that
+# changed on disk replaces its entry, so only the latest version of each attachment is kept.
+_csv_cache = {}
+
+# Known column types of the segments and assets attachments, so the parser does not infer them
+_SEGMENTS_DTYPE = {'asset': str, 'segment_id': str, 'exposure': 'int64', 'average_profitability': 'float64',
+                   'risk_weight': 'float64', 'rel_sell_cost': 'float64', 'rel_origination_cost': 'float64'}
+_ASSETS_DTYPE = {'asset': str, 'max_exposure_decrease': 'float64', 'max_exposure_increase': 'float64',
+                 'stdev_profitability': 'float64'}
+
+
+def _read_csv_cached(path: str, index_col: str, dtype: dict = None) -> pd.DataFrame:
+    key = (path, index_col, tuple(sorted(dtype.items())) if dtype else None)
+    mtime = os.path.getmtime(path)
+    cached = _csv_cache.get(key)
+    if cached is None or cached[0] != mtime:
+        cached = _csv_cache[key] = (mtime, pd.read_csv(path, index_col=index_col, dtype=dtype))
+    # load adds columns to the frames it gets, so the cached frame is never handed out
+    return cached[1].copy()
+
+
 @xi.AppConfig(name="Portfolio Rebalancing", version=xi.AppVersion(1, 0, 0), raise_attach_exceptions=True)
 class InsightApp(xi.AppBase):
     # Inputs need to be initialized in the load mode(s).
@@ -85,24 +108,23 @@ class InsightApp(xi.AppBase):
         # Input entities will be captured and stored in the scenario.
         print("Loading data.")
         # Load Segment information
-        self.Segments = pd.read_csv(self.insight.get_attach_by_tag('segments-file').filename, index_col=['segment_id'])
+        self.Segments = _read_csv_cached(self.insight.get_attach_by_tag('segments-file').filename, index_col='segment_id', dtype=_SEGMENTS_DTYPE)
         self.SegmentIds = self.Segments.index
         self.InitialExposure = float(self.Segments['exposure'].sum())
 
         self.SolutionIds = pd.Index(['Optimized Portfolio'])
 
         # Get the original exposure at the asset level
-        temp_segments = self.Segments.copy()
-        temp_segments['rwa'] = temp_segments['exposure']*temp_segments['risk_weight']
-        temp_assets = temp_segments.groupby(['asset']).agg({'exposure':'sum', 'rwa':'sum'})
+        temp_assets = pd.DataFrame({'asset': self.Segments['asset'], 'exposure': self.Segments['exposure'],
+                                    'rwa': self.Segments['exposure']*self.Segments['risk_weight']}).groupby('asset').sum()
         # Load Asset information
-        self.Assets = pd.read_csv(self.insight.get_attach_by_tag('assets-file').filename, index_col=['asset'])
+        self.Assets = _read_csv_cached(self.insight.get_attach_by_tag('assets-file').filename, index_col='asset', dtype=_ASSETS_DTYPE)
         self.AssetIds = self.Assets.index
         self.Assets['exposure'] = temp_assets['exposure']
         self.Assets['risk_weight'] = temp_assets['rwa']/temp_assets['exposure']
 
         # Load Correlation Matrix information
-        self.CorrelationMatrix = pd.read_csv(self.insight.get_attach_by_tag('correlation-file').filename, index_col=['asset'])
+        self.CorrelationMatrix = _read_csv_cached(self.insight.get_attach_by_tag('correlation-file').filename, index_col='asset')
         print("\nLoad mode finished.")
 
     @xi.ExecModeRun(descr="Takes input data and uses it to compute the results.")
@@ -114,7 +136,8 @@ class InsightApp(xi.AppBase):
         if self.ConsiderRisk==False:
             self.ProfitWeight = -1
 
-        z_score = norm.ppf(self.ConfidenceLevel)
+        from scipy.special import ndtri  # only the run mode needs scipy
+        z_score = float(ndtri(self.ConfidenceLevel))
         df_result, df_assets = solve_optimization(
             self.Segments, 
             self.Assets, 
@@ -127,22 +150,32 @@ class InsightApp(xi.AppBase):
         )
 
         # Update the results dataframes with the optimization solution
-        self.Segments['optimized_exposure'] = pd.Series(list(df_result['exposure']), index=self.SegmentIds)
+        # The results list segments grouped by asset, so align them to the input rows by label
+        df_result_by_id = df_result.set_index('segment_id').reindex(self.SegmentIds)
+        df_assets_by_id = df_assets.set_index('asset').reindex(self.AssetIds)
+        self.Segments['optimized_exposure'] = df_result_by_id['exposure'].to_numpy()
         self.Segments['exposure_change'] = (self.Segments['optimized_exposure'] - self.Segments['exposure'])
-        self.Assets['optimized_exposure'] = pd.Series(list(df_assets['total_exposure']), index=self.AssetIds)
-        self.Assets['average_risk_weight'] = pd.Series(list(df_assets['average_risk_weight']), index=self.AssetIds)
-        self.Assets['portfolio_ratio'] = self.Assets['optimized_exposure']/self.Assets['optimized_exposure'].sum()
+        self.Assets['optimized_exposure'] = df_assets_by_id['total_exposure'].to_numpy()
+        self.Assets['average_risk_weight'] = df_assets_by_id['average_risk_weight'].to_numpy()
+        # The asset totals add up to the optimized portfolio exposure, so it is summed once for the ratios and the KPIs
+        asset_exposure = df_assets_by_id['total_exposure'].to_numpy(dtype=np.float64)
+        self.OptimizedExposure = float(asset_exposure.sum())
+        self.Assets['portfolio_ratio'] = asset_exposure/self.OptimizedExposure
 
         # Calculate the different portfolio level KPIs
-        self.ExpectedProfit = (self.Segments['optimized_exposure']*self.Segments['average_profitability']).sum()
-        self.TransactionCosts = (self.Segments.loc[self.Segments['exposure_change'] > 0, 'exposure_change'] * self.Segments.loc[self.Segments['exposure_change'] > 0, 'rel_origination_cost']).sum()\
-            -(self.Segments.loc[self.Segments['exposure_change'] < 0, 'exposure_change'] * self.Segments.loc[self.Segments['exposure_change'] < 0, 'rel_sell_cost']).sum()
-        self.OptimizedExposure = float(self.Segments['optimized_exposure'].sum())
-        self.ARW = (self.Segments['optimized_exposure']*self.Segments['risk_weight']).sum()/self.OptimizedExposure
+        optimized_exposure = self.Segments['optimized_exposure'].to_numpy(dtype=np.float64)
+        exposure_change = self.Segments['exposure_change'].to_numpy(dtype=np.float64)
+        self.ExpectedProfit = float(optimized_exposure @ self.Segments['average_profitability'].to_numpy(dtype=np.float64))
+        # Increases pay the origination cost and decreases the selling cost
+        self.TransactionCosts = float(np.maximum(exposure_change, 0.0) @ self.Segments['rel_origination_cost'].to_numpy(dtype=np.float64)
+                                      - np.minimum(exposure_change, 0.0) @ self.Segments['rel_sell_cost'].to_numpy(dtype=np.float64))
+        self.ARW = float(optimized_exposure @ self.Segments['risk_weight'].to_numpy(dtype=np.float64))/self.OptimizedExposure
         self.NetProfit = self.ExpectedProfit - self.TransactionCosts
-        self.PortfolioProfitDownside = z_score * self.ExpectedProfit * math.sqrt(sum([self.Assets.loc[asset_i, 'stdev_profitability']*self.Assets.loc[asset_j, 'stdev_profitability']*
-                                     self.Assets.loc[asset_i, 'portfolio_ratio'] * self.Assets.loc[asset_j, 'portfolio_ratio'] *
-                                     self.CorrelationMatrix.loc[asset_i, asset_j] for asset_i in self.Assets.index for asset_j in self.Assets.index]))
+        w = self.Assets['portfolio_ratio'].to_numpy(dtype=np.float64)
+        stdev = self.Assets['stdev_profitability'].to_numpy(dtype=np.float64)
+        correlation = self.CorrelationMatrix.reindex(index=self.Assets.index, columns=self.Assets.index).to_numpy(dtype=np.float64)
+        variance = portfolio_variance(w, stdev, correlation)
+        self.PortfolioProfitDownside = z_score * self.ExpectedProfit * math.sqrt(variance)
 
 
         solution = [{
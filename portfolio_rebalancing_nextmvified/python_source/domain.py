@@ -3,7 +3,7 @@ from typing import Dict, Tuple
 import pandas as pd
 import os
 
-@dataclass
+@dataclass(slots=True)
 class Segment:
     """
     Class that contains the important attribute of each subsegment
@@ -16,7 +16,7 @@ class Segment:
     rel_sell_cost: float
     rel_origination_cost: float
 
-@dataclass
+@dataclass(slots=True)
 class Asset:
     """
     Class that contains the important attributes of an asset
@@ -26,7 +26,6 @@ class Asset:
     total_exposure: float = 0.0
     total_profit: float = 0.0
     total_risk_weighted_assets: float = 0.0
-    average_risk_weight: float = 0.0
     min_rel_exposure: float = 0.5  # Minimum allowable exposure for the asset
     max_rel_exposure: float = 1.5  # Maximum allowable exposure for the asset
     profit_stdev: float = 0.0  # Standard deviation of the asset's profitability
@@ -39,9 +38,15 @@ class Asset:
         self.total_exposure += segment.exposure
         self.total_profit += segment.profitability * segment.exposure
         self.total_risk_weighted_assets += segment.exposure * segment.risk_weight
-        self.average_risk_weight = self.total_risk_weighted_assets / self.total_exposure if self.total_exposure > 0 else 0
 
-@dataclass
+    @property
+    def average_risk_weight(self) -> float:
+        """
+        Exposure weighted average risk weight of the asset's segments
+        """
+        return self.total_risk_weighted_assets / self.total_exposure if self.total_exposure > 0 else 0
+
+@dataclass(slots=True)
 class Portfolio:
     """
     Class that contains the important attributes of a portfolio
@@ -69,34 +74,18 @@ class Portfolio:
         Export the portfolio data to CSV format
         """
         os.makedirs(folder_path, exist_ok=True)
-        segments_data = []
-        for asset in self.assets.values():
-            for segment in asset.segments.values():
-                segments_data.append({
-                    'asset': asset.asset_id,
-                    'segment_id': segment.segment_id,
-                    'exposure': segment.exposure,
-                    'profitability': segment.profitability,
-                    'risk_weight': segment.risk_weight,
-                    'rel_sell_cost': segment.rel_sell_cost,
-                    'rel_origination_cost': segment.rel_origination_cost
-                })
-
-        df_segments = pd.DataFrame(segments_data)
-        df_segments.set_index('segment_id')
-
-        assets_data = []
-        for asset in self.assets.values():
-            assets_data.append({
-                'asset': asset.asset_id,
-                'total_exposure': asset.total_exposure,
-                'total_profit': asset.total_profit,
-                'average_risk_weight': asset.average_risk_weight,
-                'min_rel_exposure': asset.min_rel_exposure,
-                'max_rel_exposure': asset.max_rel_exposure
-            })
+        segments_data = [(asset.asset_id, segment.segment_id, segment.exposure, segment.profitability, segment.risk_weight,
+                          segment.rel_sell_cost, segment.rel_origination_cost)
+                         for asset in self.assets.values()
+                         for segment in asset.segments.values()]
+        df_segments = pd.DataFrame(segments_data, columns=['asset', 'segment_id', 'exposure', 'profitability', 'risk_weight',
+                                                           'rel_sell_cost', 'rel_origination_cost'])
 
-        df_assets = pd.DataFrame(assets_data)
+        assets_data = [(asset.asset_id, asset.total_exposure, asset.total_profit, asset.average_risk_weight,
+                        asset.min_rel_exposure, asset.max_rel_exposure)
+                       for asset in self.assets.values()]
+        df_assets = pd.DataFrame(assets_data, columns=['asset', 'total_exposure', 'total_profit', 'average_risk_weight',
+                                                       'min_rel_exposure', 'max_rel_exposure'])
 
         if extract:
             df_segments.to_csv(f"{folder_path}/segments_{self.portfolio_id}.csv", index=False)
@@ -3,7 +3,6 @@ import os
 import nextmv
 import pandas as pd
 from instance_manager import InstanceManager
-from portfolio_optimizer import optimize_portfolio
 
 
 def solve_optimization(df_segments: pd.DataFrame, df_assets: pd.DataFrame, 
@@ -11,6 +10,9 @@ def solve_optimization(df_segments: pd.DataFrame, df_assets: pd.DataFrame,
                        consider_risk:bool = True, z_score: float = 1.96, profit_weight: float=None,
                        options: nextmv.Options=None) ->pd.DataFrame:
 
+    # Deferred so that importing this module does not load xpress
+    from portfolio_optimizer import optimize_portfolio
+
     # Load instance from CSV
     manager = InstanceManager(instance_name="")
     original_portfolio = manager.from_csv(df_segments, df_assets, df_correlation_matrix)
@@ -1,5 +1,6 @@
 from typing import Dict, Tuple
 from domain import Asset, Portfolio, Segment
+import numpy as np
 import pandas as pd
 import os
 
@@ -10,50 +11,58 @@ class InstanceManager:
     
     def from_csv(self, df_segments:pd.DataFrame, df_assets:pd.DataFrame, df_correlation_matrix: pd.DataFrame) -> Portfolio:
         # df = pd.read_csv(os.path.join(folder_path, "segments.csv"))
-        assets = {}
-        for segment_id, row in df_segments.iterrows():
-            asset_id = row['asset']
-            exposure = row['exposure']
-            risk_weight = row['risk_weight']
-            profitability = row['average_profitability']
-            rel_sell_cost = row.get('rel_sell_cost', 0.0)
-            rel_origination_cost = row.get('rel_origination_cost', 0.0)
-
-            segment = Segment(segment_id, asset_id, exposure, profitability, risk_weight, rel_sell_cost, rel_origination_cost)
-
-            if asset_id not in assets:
-                assets[asset_id] = Asset(asset_id, {segment_id: segment}, exposure, exposure * profitability, exposure * risk_weight, risk_weight)
-            else:
-                assets[asset_id].add_segment(segment)
+        # Aggregate the asset level totals once instead of updating them segment by segment
+        totals = (df_segments.assign(profit=df_segments['exposure'] * df_segments['average_profitability'],
+                                     rwa=df_segments['exposure'] * df_segments['risk_weight'])
+                  .groupby('asset', sort=False)[['exposure', 'profit', 'rwa']].sum())
+        assets = {asset_id: Asset(asset_id, {}, total_exposure, total_profit, total_rwa)
+                  for asset_id, total_exposure, total_profit, total_rwa in totals.itertuples(name=None)}
+
+        # Optional cost columns default to 0 without touching the caller's frame
+        segment_rows = df_segments[['asset', 'exposure', 'risk_weight', 'average_profitability']].assign(
+            rel_sell_cost=df_segments.get('rel_sell_cost', 0.0), rel_origination_cost=df_segments.get('rel_origination_cost', 0.0))
+        for segment_id, asset_id, exposure, risk_weight, profitability, rel_sell_cost, rel_origination_cost in segment_rows.itertuples(index=True, name=None):
+            assets[asset_id].segments[segment_id] = Segment(segment_id, asset_id, exposure, profitability, risk_weight, rel_sell_cost, rel_origination_cost)
 
         # Update asset level information
         # df = pd.read_csv(os.path.join(folder_path, "assets.csv"))
-        for asset_id, row in df_assets.iterrows():
-            min_rel_exposure = 1-row['max_exposure_decrease']
-            max_rel_exposure = 1+row['max_exposure_increase']
-            stdev = row.get('stdev_profitability', 0.0)
-
+        asset_rows = df_assets[['max_exposure_decrease', 'max_exposure_increase']].assign(stdev_profitability=df_assets.get('stdev_profitability', 0.0))
+        for asset_id, max_exposure_decrease, max_exposure_increase, stdev in asset_rows.itertuples(index=True, name=None):
             if asset_id in assets:
-                assets[asset_id].min_rel_exposure = min_rel_exposure
-                assets[asset_id].max_rel_exposure = max_rel_exposure
+                assets[asset_id].min_rel_exposure = 1-max_exposure_decrease
+                assets[asset_id].max_rel_exposure = 1+max_exposure_increase
                 assets[asset_id].profit_stdev = stdev
 
         return Portfolio(f"{self.instance_name}_input_portfolio", assets, df_correlation_matrix)
 
     def new_portfolio(self, portfolio: Portfolio, new_distribution: Dict[Tuple[str, str], float]) -> Portfolio:
-        new_assets = {}
         portfolio_id = f"{self.instance_name}_optimized_portfolio"
-        for asset in portfolio.assets.values():
-            for segment in asset.segments.values():
-                new_segment = Segment(segment.segment_id, segment.asset, segment.exposure, segment.profitability,
-                                        segment.risk_weight, segment.rel_sell_cost, segment.rel_origination_cost)
-                new_segment.exposure = round(new_distribution[(asset.asset_id, segment.segment_id)] * new_segment.exposure)
-            
-                if asset.asset_id not in new_assets:
-                    new_assets[asset.asset_id] = Asset(asset.asset_id, {new_segment.segment_id: new_segment}, new_segment.exposure, 
-                                                    new_segment.exposure * new_segment.profitability, new_segment.exposure * new_segment.risk_weight, 
-                                                    new_segment.risk_weight, asset.min_rel_exposure, asset.max_rel_exposure)
-                else:
-                    new_assets[asset.asset_id].add_segment(new_segment)
-
-        return Portfolio(portfolio_id, new_assets)
\ No newline at end of file
+        assets = list(portfolio.assets.values())
+        segments = [segment for asset in assets for segment in asset.segments.values()]
+        n_segments = len(segments)
+
+        # Rescale all segment exposures at once, then regroup them per asset
+        multipliers = np.fromiter((new_distribution[(asset.asset_id, segment_id)] for asset in assets for segment_id in asset.segments),
+                                  dtype=np.float64, count=n_segments)
+        exposures = np.fromiter((segment.exposure for segment in segments), dtype=np.float64, count=n_segments)
+        profitabilities = np.fromiter((segment.profitability for segment in segments), dtype=np.float64, count=n_segments)
+        risk_weights = np.fromiter((segment.risk_weight for segment in segments), dtype=np.float64, count=n_segments)
+        new_exposures = np.rint(multipliers * exposures).astype(np.int64)
+        new_profits = new_exposures * profitabilities
+        new_rwas = new_exposures * risk_weights
+
+        new_assets = {}
+        start = 0
+        for asset in assets:
+            end = start + len(asset.segments)
+            new_segments = {segment.segment_id: Segment(segment.segment_id, segment.asset, new_exposure, segment.profitability,
+                                                        segment.risk_weight, segment.rel_sell_cost, segment.rel_origination_cost)
+                            for segment, new_exposure in zip(segments[start:end], new_exposures[start:end].tolist())}
+            total_exposure = int(new_exposures[start:end].sum())
+            total_profit = float(new_profits[start:end].sum())
+            total_rwa = float(new_rwas[start:end].sum())
+            new_assets[asset.asset_id] = Asset(asset.asset_id, new_segments, total_exposure, total_profit, total_rwa,
+                                               asset.min_rel_exposure, asset.max_rel_exposure)
+            start = end
+
+        return Portfolio(portfolio_id, new_assets)